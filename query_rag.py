@@ -1,20 +1,70 @@
 import time
+import json
+import asyncio
+import contextlib
+import hashlib
+import functools
+import threading
 import chromadb
+import numpy as np
+import httpx
+import ollama
+import diskcache
+import tiktoken
 from llama_index.core import (
     VectorStoreIndex,
     Settings,
-    PromptTemplate
+    PromptTemplate,
+    QueryBundle,
+    get_response_synthesizer
 )
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.bridge.pydantic import PrivateAttr
 from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.ollama import OllamaEmbedding
+from llama_index.embeddings.fastembed import FastEmbedEmbedding
 from llama_index.llms.ollama import Ollama as LlamaIndexOllama
 import os, sys
 
 # --- Configuration ---
 PERSIST_DIR = "./chroma_db"
 LLM_MODEL_NAME = 'qwen3:8b-q4_K_M'
-EMBEDDING_MODEL_NAME = 'nomic-embed-text:137m-v1.5-fp16'
+EMBEDDING_MODEL_NAME = 'nomic-ai/nomic-embed-text-v1.5-Q'  # int8 ONNX export, run in-process by fastembed
+EMBED_MAX_LENGTH = 2048  # embedder input limit in tokens; must match rag_ingestion.py
 COLLECTION_NAME = "survival_docs"
+CHROMA_HOST = "localhost"  # set to None to use an embedded database at PERSIST_DIR instead
+CHROMA_PORT = 8000
+RAG_SERVER_URL = "http://localhost:8001"  # used when rag_server.py is running there; set to None to always query in-process
+SIMILARITY_TOP_K = 3
+RERANK_CANDIDATE_K = 100  # candidates fetched from Chroma for the int8 re-rank pass
+MMR_CANDIDATE_K = 20      # candidates handed to MMR, which picks SIMILARITY_TOP_K of them
+EXACT_SCAN_TOP_K = MMR_CANDIDATE_K  # candidates kept by exact score after merging the full scan into HNSW
+EXACT_SCAN_MAX_VECTORS = 200_000    # above this a full scan costs more than it saves; int8 re-rank is used instead
+MMR_LAMBDA = 0.7          # 1.0 = pure relevance, 0.0 = pure diversity
+CONTEXT_TOKEN_BUDGET = 3500  # max tokens of retrieved text sent to the LLM, bounds prefill time
+QUERY_CACHE_DIR = os.path.join(PERSIST_DIR, "qcache")  # wiped together with the index on re-ingestion
+QUERY_CACHE_SIZE = 512
+TOKEN_FLUSH_INTERVAL = 0.05  # seconds between stdout writes while streaming
+TOKEN_FLUSH_COUNT = 8        # or after this many buffered tokens
+
+# Float32 and int8 copies of the stored embeddings written by rag_ingestion.py
+VECTORS_META_PATH = os.path.join(PERSIST_DIR, "vecs.json")
+F32_VECTORS_PATH = os.path.join(PERSIST_DIR, "vecs.f32")
+INT8_VECTORS_PATH = os.path.join(PERSIST_DIR, "vecs.i8")
+INT8_SCALES_PATH = os.path.join(PERSIST_DIR, "vecs.scale.npy")
+
+# Ollama unloads an idle LLM after keep_alive; refresh well before that while the chat is open
+MODEL_KEEP_ALIVE = "30m"
+KEEP_ALIVE_REFRESH_SECONDS = 25 * 60
+
+# Long-lived keep-alive pool for the Ollama LLM clients, so a connection survives pauses between questions.
+OLLAMA_CLIENT_KWARGS = {
+    "timeout": 120.0,
+    "limits": httpx.Limits(max_keepalive_connections=16, keepalive_expiry=300),
+}
 
 
 
@@ -32,23 +82,413 @@ Prioritize the information provided in the context above all else.
 """
 
 
+class CompiledPromptTemplate(PromptTemplate):
+    """PromptTemplate that renders SYSTEM_PROMPT_RAG by plain concatenation.
+
+    The template is split once around {context_str} and {query_str}, so rendering a
+    multi-KB context joins five strings instead of re-parsing the template with str.format.
+    """
+    _prefix: str = PrivateAttr()
+    _middle: str = PrivateAttr()
+    _suffix: str = PrivateAttr()
+
+    def __init__(self, template, **kwargs):
+        if template.count("{") != 2 or template.count("}") != 2:
+            raise ValueError("CompiledPromptTemplate supports only {context_str} and {query_str} placeholders.")
+        super().__init__(template, **kwargs)
+        self._prefix, rest = template.split("{context_str}", 1)
+        self._middle, self._suffix = rest.split("{query_str}", 1)
+
+    def format(self, llm=None, completion_to_prompt=None, **kwargs):
+        all_kwargs = {**self.kwargs, **kwargs}
+        if ("context_str" not in all_kwargs or "query_str" not in all_kwargs
+                or self.output_parser or self.template_var_mappings or self.function_mappings):
+            return super().format(llm=llm, completion_to_prompt=completion_to_prompt, **kwargs)
+        prompt = "".join((self._prefix, str(all_kwargs["context_str"]), self._middle,
+                          str(all_kwargs["query_str"]), self._suffix))
+        if completion_to_prompt is not None:
+            prompt = completion_to_prompt(prompt)
+        return prompt
+
+
+class CachedQueryEmbedding(FastEmbedEmbedding):
+    """FastEmbedEmbedding that caches query embeddings in memory and on disk.
+
+    Queries are normalized (stripped and lower-cased) before lookup, so repeated
+    questions skip the embedding model, including across restarts. Embeddings are
+    scaled to unit length to match the inner-product space used at ingestion.
+    """
+    _lru_embed: object = PrivateAttr()
+    _disk_cache: object = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lru_embed = functools.lru_cache(maxsize=QUERY_CACHE_SIZE)(self._embed_normalized_query)
+
+    def _embed_normalized_query(self, query):
+        # Opened lazily so a missing PERSIST_DIR is not created before it is checked.
+        if self._disk_cache is None:
+            self._disk_cache = diskcache.Cache(QUERY_CACHE_DIR)
+        key = hashlib.blake2b(f"{self.model_name}\n{query}".encode("utf-8")).hexdigest()
+        embedding = self._disk_cache.get(key)
+        if embedding is None:
+            vec = np.asarray(super()._get_query_embedding(query), dtype=np.float32)
+            vec /= max(float(np.linalg.norm(vec)), 1e-12)
+            embedding = vec.tolist()
+            self._disk_cache.set(key, embedding)
+        return embedding
+
+    def _get_query_embedding(self, query):
+        return list(self._lru_embed(query.strip().lower()))
+
+    async def _aget_query_embedding(self, query):
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+
+def load_vectors_meta():
+    """Returns the embedding dimension and row-ordered node ids of the embedding sidecars."""
+    with open(VECTORS_META_PATH) as f:
+        meta = json.load(f)
+    return meta["dim"], meta["ids"]
+
+
+def load_f32_vectors():
+    """Memory-maps the float32 embeddings sidecar.
+
+    Returns the (num_vectors, dim) array, the row-ordered node ids and a node id -> row lookup.
+    """
+    dim, ids = load_vectors_meta()
+    vectors = np.memmap(F32_VECTORS_PATH, dtype=np.float32, mode="r", shape=(len(ids), dim))
+    row_of = {node_id: row for row, node_id in enumerate(ids)}
+    return vectors, ids, row_of
+
+
+class ExactScanRetriever(BaseRetriever):
+    """Merges an exact full-scan top-k over the float32 embeddings into the HNSW results.
+
+    Recovers chunks the approximate HNSW search missed. For corpora up to a few hundred
+    thousand chunks, one BLAS matrix-vector product over the memory-mapped embeddings
+    takes milliseconds. Returns the top_k nodes by exact inner-product score.
+    """
+
+    def __init__(self, vector_retriever, chroma_collection, vectors, ids, row_of, top_k=EXACT_SCAN_TOP_K):
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._collection = chroma_collection
+        self._top_k = top_k
+        self._vectors = vectors
+        self._ids = ids
+        self._row_of = row_of
+
+    def _retrieve(self, query_bundle):
+        nodes = self._vector_retriever.retrieve(query_bundle)
+        return self._merge_exact_top_k(nodes, query_bundle)
+
+    async def _aretrieve(self, query_bundle):
+        nodes = await self._vector_retriever.aretrieve(query_bundle)
+        return self._merge_exact_top_k(nodes, query_bundle)
+
+    def _merge_exact_top_k(self, nodes, query_bundle):
+        # The wrapped retriever has embedded the query into the bundle by now.
+        if query_bundle.embedding is None or not self._ids:
+            return nodes[:self._top_k]
+        query = np.asarray(query_bundle.embedding, dtype=np.float32)
+        scores = self._vectors @ query
+        k = min(self._top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+
+        seen = {n.node.node_id for n in nodes}
+        missing = [self._ids[row] for row in top.tolist() if self._ids[row] not in seen]
+        if missing:
+            result = self._collection.get(ids=missing, include=["documents", "metadatas"])
+            for text, metadata in zip(result["documents"], result["metadatas"]):
+                nodes.append(NodeWithScore(node=metadata_dict_to_node(metadata, text=text)))
+
+        for node in nodes:
+            row = self._row_of.get(node.node.node_id)
+            if row is not None:
+                node.score = float(scores[row])
+        return sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)[:self._top_k]
+
+
+class Int8RerankPostprocessor(BaseNodePostprocessor):
+    """Re-scores candidates against the int8 embeddings memory-mapped from PERSIST_DIR.
+
+    The query is quantized the same way as the documents, so scoring is an int8
+    dot product accumulated in int32 and rescaled by the per-vector scales.
+    """
+    top_n: int = MMR_CANDIDATE_K
+    _codes: object = PrivateAttr()
+    _scales: object = PrivateAttr()
+    _row_of: dict = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        dim, ids = load_vectors_meta()
+        self._codes = np.memmap(INT8_VECTORS_PATH, dtype=np.int8, mode="r", shape=(len(ids), dim))
+        self._scales = np.load(INT8_SCALES_PATH)
+        self._row_of = {node_id: row for row, node_id in enumerate(ids)}
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if query_bundle is None or query_bundle.embedding is None:
+            return nodes[:self.top_n]
+        known = [n for n in nodes if n.node.node_id in self._row_of]
+        if not known:
+            return nodes[:self.top_n]
+
+        query = np.asarray(query_bundle.embedding, dtype=np.float32)
+        query_scale = 127.0 / max(float(np.abs(query).max()), 1e-12)
+        query_codes = np.round(query * query_scale).astype(np.int8)
+
+        rows = np.fromiter((self._row_of[n.node.node_id] for n in known), dtype=np.int64, count=len(known))
+        dots = np.einsum("ij,j->i", self._codes[rows], query_codes, dtype=np.int32)
+        scores = dots / (self._scales[rows] * query_scale)
+        for node, score in zip(known, scores.tolist()):
+            node.score = score
+        return sorted(known, key=lambda n: n.score, reverse=True)[:self.top_n]
+
+
+class MMRNodePostprocessor(BaseNodePostprocessor):
+    """Re-selects the top nodes by maximal marginal relevance, computed with NumPy.
+
+    All query and pairwise cosine similarities are computed once up front, so each
+    selection step is a handful of vectorized array operations.
+    """
+    top_n: int = SIMILARITY_TOP_K
+    mmr_lambda: float = MMR_LAMBDA
+    _collection: object = PrivateAttr()
+    _vectors: object = PrivateAttr()
+    _row_of: dict = PrivateAttr()
+
+    def __init__(self, chroma_collection, vectors=None, row_of=None, **kwargs):
+        super().__init__(**kwargs)
+        self._collection = chroma_collection
+        self._vectors = vectors
+        self._row_of = row_of or {}
+
+    def _get_embeddings(self, nodes):
+        """Returns node embeddings, read from the float32 sidecar when it has them.
+
+        Only nodes missing from the sidecar (e.g. added after it was written) are fetched
+        from Chroma, in one call.
+        """
+        embeddings = {}
+        missing = []
+        for n in nodes:
+            node_id = n.node.node_id
+            if n.node.embedding is not None:
+                embeddings[node_id] = n.node.embedding
+            elif self._vectors is not None and node_id in self._row_of:
+                embeddings[node_id] = self._vectors[self._row_of[node_id]]
+            else:
+                missing.append(node_id)
+        if missing:
+            result = self._collection.get(ids=missing, include=["embeddings"])
+            embeddings.update(zip(result["ids"], result["embeddings"]))
+        return [embeddings[n.node.node_id] for n in nodes]
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if len(nodes) <= self.top_n or query_bundle is None or query_bundle.embedding is None:
+            return nodes[:self.top_n]
+
+        embeddings = np.asarray(self._get_embeddings(nodes), dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(query_bundle.embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        query_sims = embeddings @ query
+        pair_sims = embeddings @ embeddings.T
+
+        first = int(np.argmax(query_sims))
+        selected = [first]
+        available = np.ones(len(nodes), dtype=bool)
+        available[first] = False
+        max_sim_to_selected = pair_sims[first].copy()
+        while len(selected) < self.top_n:
+            scores = self.mmr_lambda * query_sims - (1 - self.mmr_lambda) * max_sim_to_selected
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            available[best] = False
+            np.maximum(max_sim_to_selected, pair_sims[best], out=max_sim_to_selected)
+        return [nodes[i] for i in selected]
+
+
+class TokenLimitedContextPostprocessor(BaseNodePostprocessor):
+    """Trims retrieved context to a token budget, cutting the lowest-scoring nodes' tails first.
+
+    The budget covers each node as the LLM sees it, metadata header included, but only the
+    text is trimmed. Token counts use tiktoken's cl100k_base, which is close enough to the
+    local model's tokenizer for budgeting.
+    """
+    max_tokens: int = CONTEXT_TOKEN_BUDGET
+    _encoding: object = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def _count_tokens(self, text):
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        totals = [self._count_tokens(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in nodes]
+        excess = sum(totals) - self.max_tokens
+        if excess <= 0:
+            return nodes
+
+        token_ids = [self._encoding.encode(n.node.get_content(metadata_mode=MetadataMode.NONE),
+                                           disallowed_special=()) for n in nodes]
+        kept = [len(ids) for ids in token_ids]
+        for i in sorted(range(len(nodes)), key=lambda i: nodes[i].score or 0.0):
+            cut = min(excess, kept[i])
+            kept[i] -= cut
+            excess -= cut
+            if kept[i] == 0:
+                # The node is dropped, so its metadata header no longer counts either.
+                excess -= max(totals[i] - len(token_ids[i]), 0)
+            if excess <= 0:
+                break
+
+        result = []
+        for node, ids, keep in zip(nodes, token_ids, kept):
+            if keep == 0:
+                continue
+            if keep < len(ids):
+                trimmed = node.node.model_copy()
+                trimmed.set_content(self._encoding.decode(ids[:keep]))
+                node = NodeWithScore(node=trimmed, score=node.score)
+            result.append(node)
+        return result
+
+
+class BufferedTokenWriter:
+    """Coalesces streamed tokens into fewer stdout writes.
+
+    Tokens are written once TOKEN_FLUSH_INTERVAL has passed since the last write or
+    TOKEN_FLUSH_COUNT tokens are buffered, and always when the `with` block exits.
+    """
+
+    def __init__(self, stream=None):
+        self._stream = stream or sys.stdout
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, token):
+        self._buffer.append(token)
+        if (len(self._buffer) >= TOKEN_FLUSH_COUNT
+                or time.monotonic() - self._last_flush >= TOKEN_FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._stream.write("".join(self._buffer))
+            self._buffer.clear()
+        self._stream.flush()
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+
 def setup_llm_and_embed_models():
     """Sets up the LLM and embedding models in LlamaIndex Settings."""
     print(f"Setting LLM model: {LLM_MODEL_NAME}")
-    Settings.llm = LlamaIndexOllama(model=LLM_MODEL_NAME, request_timeout=120.0)
+    Settings.llm = LlamaIndexOllama(
+        model=LLM_MODEL_NAME,
+        request_timeout=120.0,
+        keep_alive=MODEL_KEEP_ALIVE,
+        client=ollama.Client(**OLLAMA_CLIENT_KWARGS),
+        async_client=ollama.AsyncClient(**OLLAMA_CLIENT_KWARGS)
+    )
     print(f"Setting embedding model: {EMBEDDING_MODEL_NAME}")
-    Settings.embed_model = OllamaEmbedding(model_name=EMBEDDING_MODEL_NAME)
+    Settings.embed_model = CachedQueryEmbedding(
+        model_name=EMBEDDING_MODEL_NAME,
+        max_length=EMBED_MAX_LENGTH,
+        threads=os.cpu_count()
+    )
     print("LLM and embedding models set.")
 
+def ping_llm():
+    """Sends a one-token completion through the RAG prompt, loading the LLM and prefilling the system prompt."""
+    # Same model and context window as Settings.llm, so Ollama reuses the loaded model; one output token is enough.
+    warmup_llm = LlamaIndexOllama(
+        model=LLM_MODEL_NAME,
+        request_timeout=120.0,
+        keep_alive=MODEL_KEEP_ALIVE,
+        additional_kwargs={"num_predict": 1}
+    )
+    warmup_llm.predict(CompiledPromptTemplate(SYSTEM_PROMPT_RAG), context_str="warmup", query_str="hello")
+
+def warm_up_llm():
+    """Loads the LLM in Ollama and prefills the system prompt before the first real question."""
+    print("Warming up the LLM...")
+    try:
+        ping_llm()
+        print("LLM warmed up.")
+    except Exception as e:
+        print(f"LLM warm-up failed, continuing without it: {e}")
+
+
+class ModelKeepAlive:
+    """Keeps the LLM loaded in Ollama through idle pauses in the chat.
+
+    Every KEEP_ALIVE_REFRESH_SECONDS a background timer sends a one-token completion,
+    which resets Ollama's MODEL_KEEP_ALIVE countdown.
+    """
+
+    def __init__(self):
+        self._timer = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._schedule()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def _schedule(self):
+        if self._stopped.is_set():
+            return
+        self._timer = threading.Timer(KEEP_ALIVE_REFRESH_SECONDS, self._refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh(self):
+        try:
+            ping_llm()
+        except Exception:
+            pass # Ollama unreachable right now; the next query loads the model again
+        self._schedule()
+
+
+def get_chroma_client():
+    """Connects to the Chroma server, or opens an embedded client when CHROMA_HOST is None."""
+    if CHROMA_HOST is None:
+        print(f"Loading ChromaDB client from {PERSIST_DIR}...")
+        return chromadb.PersistentClient(path=PERSIST_DIR)
+    print(f"Connecting to ChromaDB server at {CHROMA_HOST}:{CHROMA_PORT}...")
+    return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+
 def load_vector_store_and_index():
     """Loads the existing ChromaDB vector store and creates an index from it."""
-    if not os.path.exists(PERSIST_DIR):
+    if CHROMA_HOST is None and not os.path.exists(PERSIST_DIR):
         print(f"ERROR: ChromaDB persistence directory '{PERSIST_DIR}' not found.")
         print("Please run the rag_ingestion.py script first to create and populate the database.")
         sys.exit(1)
 
-    print(f"Loading ChromaDB client from {PERSIST_DIR}...")
-    db = chromadb.PersistentClient(path=PERSIST_DIR)
+    try:
+        db = get_chroma_client()
+    except Exception as e:
+        print(f"Error connecting to ChromaDB: {e}")
+        print(f"Ensure the Chroma server is running at {CHROMA_HOST}:{CHROMA_PORT}.")
+        sys.exit(1)
     print(f"Getting Chroma collection: {COLLECTION_NAME}")
     try:
         chroma_collection = db.get_collection(COLLECTION_NAME)
@@ -67,20 +507,135 @@ def load_vector_store_and_index():
     return index
 
 def create_query_engine(index):
-    """Creates a query engine from the loaded index."""
-    qa_template = PromptTemplate(SYSTEM_PROMPT_RAG)
+    """Creates a query engine from a retriever and streaming synthesizer built once up front."""
+    qa_template = CompiledPromptTemplate(SYSTEM_PROMPT_RAG)
 
     print("Creating query engine (with streaming enabled)...")
-    query_engine = index.as_query_engine(
-        similarity_top_k=3,
+    collection = index.vector_store.client
+    vectors, ids, row_of = None, [], {}
+    if os.path.exists(F32_VECTORS_PATH):
+        vectors, ids, row_of = load_f32_vectors()
+
+    # Exact scores from the full scan beat any re-rank, so the int8 pass only runs when
+    # the corpus is too large to scan.
+    node_postprocessors = []
+    if vectors is not None and len(ids) <= EXACT_SCAN_MAX_VECTORS:
+        retriever = ExactScanRetriever(
+            index.as_retriever(similarity_top_k=MMR_CANDIDATE_K),
+            chroma_collection=collection, vectors=vectors, ids=ids, row_of=row_of
+        )
+    elif os.path.exists(INT8_VECTORS_PATH):
+        if vectors is not None:
+            print(f"Corpus exceeds {EXACT_SCAN_MAX_VECTORS} chunks; using the int8 re-rank pass instead of an exact scan.")
+        retriever = index.as_retriever(similarity_top_k=RERANK_CANDIDATE_K)
+        node_postprocessors.append(Int8RerankPostprocessor())
+    else:
+        print(f"No embedding sidecars found in {PERSIST_DIR}; using HNSW results only.")
+        retriever = index.as_retriever(similarity_top_k=MMR_CANDIDATE_K)
+    node_postprocessors.append(MMRNodePostprocessor(chroma_collection=collection, vectors=vectors, row_of=row_of))
+    node_postprocessors.append(TokenLimitedContextPostprocessor())
+
+    synthesizer = get_response_synthesizer(
         text_qa_template=qa_template,
         streaming=True  # Enable streaming
     )
+    query_engine = RetrieverQueryEngine(
+        retriever=retriever,
+        response_synthesizer=synthesizer,
+        node_postprocessors=node_postprocessors
+    )
     print("Query engine created.")
     return query_engine
 
-def run_chat_loop(query_engine):
-    """Runs the interactive chat loop."""
+def source_to_dict(node):
+    """Summarizes a retrieved node for display or for sending over the wire."""
+    file_name = node.metadata.get('file_name', 'N/A') if node.metadata else 'N/A'
+    return {"id": node.node_id, "score": node.score, "file_name": file_name}
+
+def format_sources(sources):
+    """Renders the retrieved sources as one block of text."""
+    if not sources:
+        return "  - No sources retrieved."
+    return "\n".join(
+        f"  Source {i+1}:\n"
+        f"    ID: {source['id']}\n"
+        f"    Score: {source['score']:.4f}\n"
+        f"    File: {source['file_name']}"
+        for i, source in enumerate(sources)
+    )
+
+async def answer_events(query_engine, user_input):
+    """Answers a question in-process.
+
+    Yields ("token", text) for each streamed token, then a single ("sources", [...]) event.
+    """
+    query_bundle = QueryBundle(user_input)
+    # Retrieval (Chroma's sync client, the NumPy passes, token counting) blocks, so it runs on a
+    # worker thread and the event loop stays free to stream other answers meanwhile.
+    nodes = await asyncio.to_thread(query_engine.retrieve, query_bundle)
+    response_obj = await query_engine.asynthesize(query_bundle, nodes)
+
+    if hasattr(response_obj, 'async_response_gen'):
+        async for token in response_obj.async_response_gen():
+            yield "token", token
+    elif getattr(response_obj, 'response', None):
+        yield "token", response_obj.response.strip()
+    yield "sources", [source_to_dict(node) for node in response_obj.source_nodes]
+
+async def server_answer_events(client, user_input):
+    """Answers a question by reading the SSE stream from rag_server.py.
+
+    Yields the same events as answer_events.
+    """
+    url = f"{RAG_SERVER_URL}/stream"
+    async with client.stream("GET", url, params={"q": user_input}) as response:
+        response.raise_for_status()
+        event = "message"
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "error":
+                    raise RuntimeError(f"RAG server error: {data['error']}")
+                if event == "sources":
+                    yield "sources", data["sources"]
+                else:
+                    yield "token", data["token"]
+            elif not line:
+                event = "message"
+
+async def stream_answer(answer, user_input):
+    """Streams one answer to stdout and returns its sources."""
+    sources = []
+    with BufferedTokenWriter() as writer:
+        async for kind, payload in answer(user_input):
+            if kind == "token":
+                writer.write(payload)
+            else:
+                sources = payload
+    return sources
+
+def run_on_loop(loop, coro):
+    """Runs `coro` to completion on `loop`, cancelling it cleanly if Ctrl+C interrupts it."""
+    task = loop.create_task(coro)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                loop.run_until_complete(task)
+        elif not task.cancelled():
+            task.exception() # Mark the interrupt as retrieved so asyncio does not log it again
+        raise
+
+def run_chat_loop(answer, loop):
+    """Runs the interactive chat loop.
+
+    `answer` is called with each question and returns an async iterator of answer events,
+    which is driven on `loop`. Input is read synchronously, so Ctrl+C exits cleanly.
+    """
     print("\nStarting RAG chat. Type 'quit' or 'exit' to end.")
     while True:
         try:
@@ -91,37 +646,19 @@ def run_chat_loop(query_engine):
                 print(f"\nQuerying with: '{user_input}'...")
                 t0 = time.perf_counter()
 
-                response_obj = query_engine.query(user_input)
-
                 print("\n--- Assistant Response ---")
-                if hasattr(response_obj, 'response_gen'):
-                    for token in response_obj.response_gen:
-                        print(token, end="", flush=True)
-                    sys.stdout.flush() 
-                    print() 
-                else:
-                    print("Streaming response generator not found. Displaying full response.")
-                    if hasattr(response_obj, 'response') and response_obj.response:
-                        print(response_obj.response.strip())
-                    else:
-                        print("No response text available.")
+                sources = run_on_loop(loop, stream_answer(answer, user_input))
+                print()
                 
                 t1 = time.perf_counter()
 
-                print("-------------------------")
-                print(f"Response time: {t1 - t0:.2f} seconds")
-
-                print("\n--- Retrieved Sources ---")
-                if response_obj.source_nodes:
-                    for i, node in enumerate(response_obj.source_nodes):
-                        print(f"  Source {i+1}:")
-                        print(f"    ID: {node.node_id}")
-                        print(f"    Score: {node.score:.4f}")
-                        file_name = node.metadata.get('file_name', 'N/A') if node.metadata else 'N/A'
-                        print(f"    File: {file_name}")
-                else:
-                    print("  - No sources retrieved.")
-                print("-------------------------\n")
+                sys.stdout.write(
+                    "-------------------------\n"
+                    f"Response time: {t1 - t0:.2f} seconds\n"
+                    "\n--- Retrieved Sources ---\n"
+                    f"{format_sources(sources)}\n"
+                    "-------------------------\n\n"
+                )
             else:
                 print("Please enter a prompt.")
         except EOFError:
@@ -136,15 +673,48 @@ def run_chat_loop(query_engine):
             traceback.print_exc()
     print("\nExiting chat.")
 
+def rag_server_available():
+    """Checks whether rag_server.py is up at RAG_SERVER_URL, with its models and index already loaded."""
+    try:
+        response = httpx.get(f"{RAG_SERVER_URL}/health", timeout=0.5)
+        return response.status_code == 200 and response.json().get("status") == "ok"
+    except (httpx.HTTPError, ValueError):
+        return False
+
+def run_server_chat_loop(loop):
+    """Runs the chat loop as a thin client of rag_server.py."""
+    print(f"Streaming answers from RAG server at {RAG_SERVER_URL}")
+    client = httpx.AsyncClient(timeout=None)
+    try:
+        run_chat_loop(functools.partial(server_answer_events, client), loop)
+    finally:
+        loop.run_until_complete(client.aclose())
+
 
 def main():
     """Main function to run the RAG query interface."""
     print("--- Starting RAG Query Interface ---")
     
-    setup_llm_and_embed_models()
-    index = load_vector_store_and_index()
-    query_engine = create_query_engine(index)
-    run_chat_loop(query_engine)
+    # One event loop for the whole session, so async HTTP clients keep their connections between questions.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        # A running rag_server.py already holds warm models and a loaded index, so reuse it.
+        if RAG_SERVER_URL and rag_server_available():
+            run_server_chat_loop(loop)
+        else:
+            setup_llm_and_embed_models()
+            warm_up_llm()
+            index = load_vector_store_and_index()
+            query_engine = create_query_engine(index)
+            keep_alive = ModelKeepAlive().start()
+            try:
+                run_chat_loop(functools.partial(answer_events, query_engine), loop)
+            finally:
+                keep_alive.stop()
+    finally:
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
     
     print("--- RAG Query Interface Closed ---")
 
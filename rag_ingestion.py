@@ -1,15 +1,27 @@
 import os
 import sys
+import json
+import asyncio
 import shutil
 import chromadb
+from chromadb.api.client import SharedSystemClient
+try:
+    from chromadb.errors import NotFoundError
+except ImportError:  # older clients raise ValueError for a missing collection
+    NotFoundError = ValueError
+import numpy as np
+import httpx
+import ollama
 from llama_index.core import (
     VectorStoreIndex,
-    StorageContext,
     Settings,
     SimpleDirectoryReader
 )
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
 from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.ollama import OllamaEmbedding
+from llama_index.embeddings.fastembed import FastEmbedEmbedding
 from llama_index.llms.ollama import Ollama as LlamaIndexOllama
 
 
@@ -17,18 +29,79 @@ from llama_index.llms.ollama import Ollama as LlamaIndexOllama
 PERSIST_DIR     = "./chroma_db"
 COLLECTION_NAME = "survival_docs"
 DATA_DIR        = "./survival_docs" 
+DATA_EXTS       = [".md", ".txt", ".pdf"]  # other file types are skipped rather than sent to fallback parsers
+CHROMA_HOST     = "localhost"  # set to None to use an embedded database at PERSIST_DIR instead
+CHROMA_PORT     = 8000
+# With the embedded database, ingest into tmpfs and copy to PERSIST_DIR once at the end,
+# so HNSW/SQLite flushes during ingestion never wait on the disk. None disables staging.
+INGEST_STAGING_DIR = "/dev/shm/chroma_db"
+
+# Float32 and int8 copies of the stored embeddings, row-aligned with the node ids in VECTORS_META_PATH
+VECTORS_META_PATH = os.path.join(PERSIST_DIR, "vecs.json")
+F32_VECTORS_PATH  = os.path.join(PERSIST_DIR, "vecs.f32")
+INT8_VECTORS_PATH = os.path.join(PERSIST_DIR, "vecs.i8")
+INT8_SCALES_PATH  = os.path.join(PERSIST_DIR, "vecs.scale.npy")
 
 LLM_MODEL_NAME       = 'qwen3:8b-q4_K_M'
-EMBEDDING_MODEL_NAME = 'nomic-embed-text:137m-v1.5-fp16'
+EMBEDDING_MODEL_NAME = 'nomic-ai/nomic-embed-text-v1.5-Q'  # int8 ONNX export, run in-process by fastembed
+CHUNK_SIZE           = 1024  # SentenceSplitter chunk size, in tokens
+# Embedder input limit in its own WordPiece tokens. fastembed defaults to 512, which would silently
+# drop the back half of each chunk; 2048 covers a CHUNK_SIZE chunk plus its metadata header. Keep in step with query_rag.py.
+EMBED_MAX_LENGTH     = 2048
+
+# Long-lived keep-alive pool for the Ollama LLM clients, so requests reuse one connection.
+OLLAMA_CLIENT_KWARGS = {
+    "timeout": 120.0,
+    "limits": httpx.Limits(max_keepalive_connections=16, keepalive_expiry=300),
+}
+
+EMBED_BATCH_SIZE  = 64    # texts per embedding call
+INSERT_BATCH_SIZE = 2000  # nodes per Chroma insert
+
+# HNSW index settings, fixed when the collection is created and read back by query_rag.py.
+# Embeddings are stored unit-length, so inner product ranks like cosine without per-distance normalization.
+# Larger batch_size/sync_threshold defer index.bin flushes so inserts amortize across many vectors.
+HNSW_METADATA = {
+    "hnsw:space": "ip",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+    "hnsw:batch_size": 500,
+    "hnsw:sync_threshold": 2000,
+}
 
 def setup_llm_and_embed_models():
     """Sets up the LLM and embedding models in LlamaIndex Settings."""
     print(f"Setting LLM model: {LLM_MODEL_NAME}")
-    Settings.llm = LlamaIndexOllama(model=LLM_MODEL_NAME, request_timeout=120.0)
+    Settings.llm = LlamaIndexOllama(
+        model=LLM_MODEL_NAME,
+        request_timeout=120.0,
+        client=ollama.Client(**OLLAMA_CLIENT_KWARGS),
+        async_client=ollama.AsyncClient(**OLLAMA_CLIENT_KWARGS)
+    )
     print(f"Setting embedding model: {EMBEDDING_MODEL_NAME}")
-    Settings.embed_model = OllamaEmbedding(model_name=EMBEDDING_MODEL_NAME)
+    Settings.embed_model = FastEmbedEmbedding(
+        model_name=EMBEDDING_MODEL_NAME,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        max_length=EMBED_MAX_LENGTH,
+        threads=os.cpu_count()
+    )
     print("LLM and embedding models set.")
 
+def use_staging_dir():
+    """Returns True when the embedded database is built in INGEST_STAGING_DIR (tmpfs is available)."""
+    return (CHROMA_HOST is None and INGEST_STAGING_DIR is not None
+            and os.path.isdir(os.path.dirname(INGEST_STAGING_DIR)))
+
+def get_chroma_client():
+    """Connects to the Chroma server, or opens an embedded client when CHROMA_HOST is None."""
+    if CHROMA_HOST is None:
+        path = INGEST_STAGING_DIR if use_staging_dir() else PERSIST_DIR
+        print(f"Initializing ChromaDB client at {path}...")
+        return chromadb.PersistentClient(path=path)
+    print(f"Connecting to ChromaDB server at {CHROMA_HOST}:{CHROMA_PORT}...")
+    return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+
 def initialize_vector_store():
     """Initializes or wipes and re-initializes the ChromaDB vector store."""
     if os.path.exists(PERSIST_DIR):
@@ -37,14 +110,47 @@ def initialize_vector_store():
     
     os.makedirs(PERSIST_DIR, exist_ok=True) # Ensure dir exists after wipe
 
-    print(f"Initializing ChromaDB client at {PERSIST_DIR}...")
-    db = chromadb.PersistentClient(path=PERSIST_DIR)
+    if use_staging_dir() and os.path.exists(INGEST_STAGING_DIR):
+        shutil.rmtree(INGEST_STAGING_DIR)
+
+    try:
+        db = get_chroma_client()
+    except Exception as e:
+        print(f"Error connecting to ChromaDB: {e}")
+        print(f"Ensure the Chroma server is running at {CHROMA_HOST}:{CHROMA_PORT}.")
+        sys.exit(1)
+    if CHROMA_HOST is not None:
+        try:
+            db.delete_collection(COLLECTION_NAME)
+            print(f"Wiped previous collection '{COLLECTION_NAME}' on the server")
+        except (NotFoundError, ValueError):
+            pass # Nothing to wipe on a fresh server
+        except Exception as e:
+            # Carrying on would reuse the old collection, with its old HNSW settings and rows.
+            print(f"Error wiping previous collection '{COLLECTION_NAME}': {e}")
+            print(f"Ensure the Chroma server at {CHROMA_HOST}:{CHROMA_PORT} is reachable, or delete the collection manually.")
+            sys.exit(1)
     print(f"Getting or creating Chroma collection: {COLLECTION_NAME}")
-    chroma_collection = db.get_or_create_collection(COLLECTION_NAME)
+    chroma_collection = db.get_or_create_collection(COLLECTION_NAME, metadata=HNSW_METADATA)
     vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
     print("ChromaDB vector store initialized.")
     return vector_store
 
+def close_chroma_clients():
+    """Stops every cached embedded Chroma client, flushing and closing its SQLite and HNSW files."""
+    SharedSystemClient.clear_system_cache()
+
+def sync_staging_dir():
+    """Copies the database built in tmpfs to PERSIST_DIR, syncs it to disk once and frees the tmpfs copy.
+
+    The client that built the database must be closed first, so the copy is not of live files.
+    """
+    print(f"Copying database from {INGEST_STAGING_DIR} to {PERSIST_DIR}...")
+    shutil.copytree(INGEST_STAGING_DIR, PERSIST_DIR, dirs_exist_ok=True)
+    os.sync()
+    # Only reached once the copy has succeeded; on failure the tmpfs copy is left for recovery.
+    shutil.rmtree(INGEST_STAGING_DIR)
+
 def load_documents():
     """Loads documents from the DATA_DIR."""
     if not os.path.exists(DATA_DIR) or not os.listdir(DATA_DIR):
@@ -54,9 +160,11 @@ def load_documents():
 
     print(f"Loading documents from {DATA_DIR}...")
     try:
-        documents = SimpleDirectoryReader(DATA_DIR).load_data()
+        reader = SimpleDirectoryReader(DATA_DIR, recursive=True, required_exts=DATA_EXTS)
+        num_workers = min(os.cpu_count() or 1, len(reader.input_files))
+        documents = reader.load_data(num_workers=num_workers)
         if not documents:
-            print(f"No documents found in {DATA_DIR}. Please add some text files.")
+            print(f"No documents found in {DATA_DIR}. Please add some {', '.join(DATA_EXTS)} files.")
             sys.exit(1)
         print(f"Loaded {len(documents)} document(s).")
         return documents
@@ -65,16 +173,77 @@ def load_documents():
         print(f"Please ensure '{DATA_DIR}' exists and contains readable files.")
         sys.exit(1)
 
-def ingest_documents(documents, vector_store):
-    """Creates an index and ingests documents into the vector store."""
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    
-    print("Creating index and ingesting documents into ChromaDB...")
-    index = VectorStoreIndex.from_documents(
-        documents,
-        storage_context=storage_context,
-        show_progress=True
-    )
+def normalize_embeddings(embeddings):
+    """Scales a batch of embeddings to unit length as a float32 array."""
+    vecs = np.asarray(embeddings, dtype=np.float32)
+    vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    return vecs
+
+def quantize_embeddings(vecs):
+    """Quantizes float32 embeddings to int8 codes with a per-vector scale (vec ~= code / scale)."""
+    scales = 127.0 / np.maximum(np.abs(vecs).max(axis=1), 1e-12)
+    codes = np.round(vecs * scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def write_memmap(path, array):
+    """Writes an array to a raw file that query_rag.py memory-maps."""
+    mm = np.memmap(path, dtype=array.dtype, mode="w+", shape=array.shape)
+    mm[:] = array
+    mm.flush()
+    del mm
+
+def save_vectors(node_ids, vecs):
+    """Writes the float32 and int8 embeddings used by query_rag.py for its exact-scan and re-rank passes."""
+    write_memmap(F32_VECTORS_PATH, vecs)
+    codes, scales = quantize_embeddings(vecs)
+    write_memmap(INT8_VECTORS_PATH, codes)
+    np.save(INT8_SCALES_PATH, scales)
+    with open(VECTORS_META_PATH, "w") as f:
+        json.dump({"dim": int(vecs.shape[1]), "ids": node_ids}, f)
+    print(f"Saved float32 and int8 embeddings for {len(node_ids)} chunk(s) to {PERSIST_DIR}")
+
+async def embed_nodes(nodes):
+    """Embeds nodes one batch at a time on a worker thread, leaving the event loop free for the Chroma insert.
+
+    Batches run sequentially because ONNX Runtime already uses every core per call.
+    Returns the unit-length embeddings as a float32 array in node order.
+    """
+    embeddings = []
+    for i in range(0, len(nodes), EMBED_BATCH_SIZE):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes[i:i + EMBED_BATCH_SIZE]]
+        embeddings.extend(await asyncio.to_thread(Settings.embed_model.get_text_embedding_batch, texts))
+    vecs = normalize_embeddings(embeddings)
+    for node, embedding in zip(nodes, vecs.tolist()):
+        node.embedding = embedding
+    return vecs
+
+async def ingest_documents(documents, vector_store):
+    """Chunks and batch-embeds documents, then inserts them into the vector store.
+
+    Embedding of the next insert batch overlaps with the Chroma insert of the
+    previous one, which runs in a worker thread.
+    """
+    print("Splitting documents into chunks...")
+    pipeline = IngestionPipeline(transformations=[SentenceSplitter(chunk_size=CHUNK_SIZE)])
+    nodes = pipeline.run(documents=documents, show_progress=True)
+    print(f"Created {len(nodes)} chunk(s).")
+
+    print(f"Embedding and ingesting chunks (batches of {EMBED_BATCH_SIZE})...")
+    pending_insert = None
+    all_vecs = []
+    for start in range(0, len(nodes), INSERT_BATCH_SIZE):
+        batch = nodes[start:start + INSERT_BATCH_SIZE]
+        all_vecs.append(await embed_nodes(batch))
+        if pending_insert is not None:
+            await pending_insert
+        pending_insert = asyncio.create_task(asyncio.to_thread(vector_store.add, batch))
+        print(f"  Embedded {start + len(batch)}/{len(nodes)} chunk(s).")
+    if pending_insert is not None:
+        await pending_insert
+    if nodes:
+        save_vectors([node.node_id for node in nodes], np.concatenate(all_vecs))
+
+    index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
     print("Index created and documents ingested successfully.")
     return index
 
@@ -85,10 +254,16 @@ def main():
     setup_llm_and_embed_models()
     vector_store = initialize_vector_store()
     documents = load_documents()
-    ingest_documents(documents, vector_store)
+    asyncio.run(ingest_documents(documents, vector_store))
+    if use_staging_dir():
+        # Drop the last reference to the client and stop it before copying its files.
+        del vector_store
+        close_chroma_clients()
+        sync_staging_dir()
     
     print("--- RAG Ingestion Process Complete ---")
-    print(f"Data ingested into ChromaDB at {PERSIST_DIR} using collection '{COLLECTION_NAME}'.")
+    location = PERSIST_DIR if CHROMA_HOST is None else f"{CHROMA_HOST}:{CHROMA_PORT}"
+    print(f"Data ingested into ChromaDB at {location} using collection '{COLLECTION_NAME}'.")
     print("You can now run query_rag.py to chat with your documents.")
 
 if __name__ == "__main__":
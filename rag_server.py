@@ -0,0 +1,65 @@
+import json
+from contextlib import asynccontextmanager
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from query_rag import (
+    setup_llm_and_embed_models,
+    warm_up_llm,
+    ModelKeepAlive,
+    load_vector_store_and_index,
+    create_query_engine,
+    answer_events
+)
+
+# --- Configuration ---
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8001  # ChromaDB already uses 8000
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Loads the models and query engine once, before the server accepts requests."""
+    setup_llm_and_embed_models()
+    warm_up_llm()
+    index = load_vector_store_and_index()
+    app.state.query_engine = create_query_engine(index)
+    keep_alive = ModelKeepAlive().start()
+    yield
+    keep_alive.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+async def token_stream(query_engine, q):
+    """Formats answer events as Server-Sent Events."""
+    try:
+        async for kind, payload in answer_events(query_engine, q):
+            if kind == "token":
+                yield f"data: {json.dumps({'token': payload})}\n\n"
+            else:
+                yield f"event: sources\ndata: {json.dumps({'sources': payload})}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+@app.get("/health")
+async def health():
+    """Lets query_rag.py detect a running server before loading its own index."""
+    return {"status": "ok"}
+
+@app.get("/stream")
+async def stream(q: str):
+    """Streams the answer to `q` token by token."""
+    return StreamingResponse(
+        token_stream(app.state.query_engine, q),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def main():
+    """Main function to run the RAG streaming server."""
+    print("--- Starting RAG Server ---")
+    uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
+    print("--- RAG Server Stopped ---")
+
+if __name__ == "__main__":
+    main()